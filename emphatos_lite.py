@@ -1,5 +1,9 @@
+import os
 import re
 import json
+import time
+import uuid
+import tempfile
 import streamlit as st
 from openai import OpenAI
 
@@ -19,6 +23,28 @@ LANGUAGE_OPTIONS = [
     "Hungarian", "German", "Czech", "Polish", "Vulcan"
 ]
 
+CHANNEL_OPTIONS = ["Email (private)", "Public post"]
+STAGES = ["init", "asked", "done", "reviewed", "translated", "reviewed_translation"]
+
+# Durable snapshots: one compact JSON file per ticket, rewritten at every
+# stage transition so a reload can resume without calling the model again.
+# Layout: SNAPSHOT_DIR/<owner>/<ticket_id>.json holds the full state and a
+# small <ticket_id>.meta.json sidecar feeds the resume picker, so listing
+# never parses full snapshots. The owner key is kept in the tab's URL
+# (?owner=...) and is the only access control: anyone holding the URL can
+# resume its tickets, and the files are plain text on the server's disk.
+SNAPSHOT_DIR = os.environ.get("EMPATHOS_SNAPSHOT_DIR", ".empathos_snapshots")
+SNAPSHOT_VERSION = 2
+SNAPSHOT_RETENTION_DAYS = 7
+SNAPSHOT_MAX_FILES = 50     # per owner
+SNAPSHOT_KEYS = {           # session-state key -> expected type
+    "stage": str, "questions": list, "answers": dict, "draft": str,
+    "reviewed_draft": str, "translation": str, "reviewed_translation": str,
+    "operator_notes": str, "signature": str, "messages": list, "api_log": list,
+    "client_review": str, "channel_type": str, "custom_prompt": str
+}
+SNAPSHOT_ID_RE = re.compile(r"[0-9a-f]{32}")  # owner keys and ticket ids (uuid4 hex)
+
 FUNCTIONS = [
     {
         "name": "request_additional_info",
@@ -112,12 +138,229 @@ def log_run_llm(messages, api_key, functions=None, function_call="auto"):
     return response_msg
 
 
+def _to_jsonable(obj):
+    """
+    json.dumps fallback: OpenAI response objects (e.g. function_call) are pydantic models.
+    """
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    return str(obj)
+
+
+def _write_json_atomic(path, data):
+    """
+    Writes data to path through a unique temp file, so concurrent writers never collide.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".json.tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"), default=_to_jsonable)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def save_snapshot():
+    """
+    Writes the current ticket's pipeline state to SNAPSHOT_DIR/<owner>/<ticket_id>.json,
+    plus the .meta.json sidecar used by the resume picker.
+    Failures are reported but never interrupt the pipeline.
+    """
+    ticket_id = st.session_state.ticket_id
+    owner_dir = os.path.join(SNAPSHOT_DIR, st.session_state.owner_key)
+    saved_at = time.time()
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "ticket_id": ticket_id,
+        "saved_at": saved_at,
+        "state": {k: st.session_state[k] for k in SNAPSHOT_KEYS if k in st.session_state}
+    }
+    meta = {
+        "version": SNAPSHOT_VERSION,
+        "ticket_id": ticket_id,
+        "saved_at": saved_at,
+        "stage": st.session_state.stage,
+        "preview": str(st.session_state.get("client_review") or "").strip().replace("\n", " ")[:60]
+    }
+    try:
+        os.makedirs(owner_dir, exist_ok=True)
+        _write_json_atomic(os.path.join(owner_dir, f"{ticket_id}.json"), snapshot)
+        _write_json_atomic(os.path.join(owner_dir, f"{ticket_id}.meta.json"), meta)
+    except (OSError, TypeError, ValueError) as e:
+        st.warning(f"⚠️ Could not save session snapshot: {e}")
+        return
+    prune_owner_snapshots(st.session_state.owner_key)
+
+
+@st.cache_data(max_entries=100, show_spinner=False)
+def _read_snapshot_index(owner_dir, dir_mtime_ns):
+    """
+    Parses the owner's .meta.json sidecars. Cached on the directory mtime, which
+    changes whenever a snapshot is written or removed.
+    """
+    entries = []
+    try:
+        names = os.listdir(owner_dir)
+    except OSError:
+        return entries
+    for name in names:
+        if not name.endswith(".meta.json") or not SNAPSHOT_ID_RE.fullmatch(name[:-len(".meta.json")]):
+            continue
+        try:
+            with open(os.path.join(owner_dir, name), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if (
+            isinstance(meta, dict)
+            and meta.get("version") == SNAPSHOT_VERSION
+            and meta.get("ticket_id") == name[:-len(".meta.json")]
+            and isinstance(meta.get("saved_at"), (int, float))
+            and meta.get("stage") in STAGES
+            and isinstance(meta.get("preview"), str)
+        ):
+            entries.append(meta)
+    entries.sort(key=lambda m: m["saved_at"], reverse=True)
+    return entries
+
+
+def list_snapshots(owner_key):
+    """
+    Returns summaries (ticket_id, saved_at, stage, preview) of the owner's snapshots, newest first.
+    Costs one stat per rerun unless the owner's directory has changed.
+    Malformed sidecars are skipped so one bad file can't break the page.
+    """
+    owner_dir = os.path.join(SNAPSHOT_DIR, owner_key)
+    try:
+        dir_mtime_ns = os.stat(owner_dir).st_mtime_ns
+    except OSError:
+        return []
+    return _read_snapshot_index(owner_dir, dir_mtime_ns)
+
+
+def load_snapshot_state(owner_key, ticket_id):
+    """
+    Reads one full snapshot and returns its validated state, or None if it is missing or malformed.
+    Only SNAPSHOT_KEYS are returned, so a file can never set widget or button keys.
+    """
+    if not SNAPSHOT_ID_RE.fullmatch(ticket_id):
+        return None
+    try:
+        with open(os.path.join(SNAPSHOT_DIR, owner_key, f"{ticket_id}.json"), encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (
+        not isinstance(snapshot, dict)
+        or snapshot.get("version") != SNAPSHOT_VERSION
+        or snapshot.get("ticket_id") != ticket_id
+        or not isinstance(snapshot.get("state"), dict)
+    ):
+        return None
+    state = {k: v for k, v in snapshot["state"].items() if k in SNAPSHOT_KEYS}
+    if any(not isinstance(v, SNAPSHOT_KEYS[k]) for k, v in state.items()):
+        return None
+    if state.get("stage") not in STAGES:
+        return None
+    if "channel_type" in state and state["channel_type"] not in CHANNEL_OPTIONS:
+        return None
+    return state
+
+
+def _prune_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _stat_mtimes(directory):
+    """
+    Returns [(name, mtime)] for the files in directory. Other sessions may prune
+    concurrently, so entries that vanish mid-way are skipped.
+    """
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    result = []
+    for name in names:
+        try:
+            result.append((name, os.stat(os.path.join(directory, name)).st_mtime))
+        except OSError:
+            continue
+    return result
+
+
+def prune_owner_snapshots(owner_key):
+    """
+    Keeps at most SNAPSHOT_MAX_FILES snapshots (with their sidecars) for one owner.
+    """
+    owner_dir = os.path.join(SNAPSHOT_DIR, owner_key)
+    snapshots = [
+        (mtime, name) for name, mtime in _stat_mtimes(owner_dir)
+        if name.endswith(".json") and not name.endswith(".meta.json")
+    ]
+    snapshots.sort(reverse=True)
+    stale = []
+    for _, name in snapshots[SNAPSHOT_MAX_FILES:]:
+        ticket_id = name[:-len(".json")]
+        stale += [os.path.join(owner_dir, name), os.path.join(owner_dir, f"{ticket_id}.meta.json")]
+    _prune_files(stale)
+
+
+def prune_expired_snapshots():
+    """
+    Deletes snapshot files, sidecars and leftover *.json.tmp files older than
+    SNAPSHOT_RETENTION_DAYS, across all owners.
+    """
+    cutoff = time.time() - SNAPSHOT_RETENTION_DAYS * 86400
+    for owner_key, _ in _stat_mtimes(SNAPSHOT_DIR):
+        owner_dir = os.path.join(SNAPSHOT_DIR, owner_key)
+        if not SNAPSHOT_ID_RE.fullmatch(owner_key) or not os.path.isdir(owner_dir):
+            continue
+        _prune_files([
+            os.path.join(owner_dir, name) for name, mtime in _stat_mtimes(owner_dir)
+            if name.endswith((".json", ".json.tmp")) and mtime < cutoff
+        ])
+
+
+def restore_snapshot(ticket_id):
+    """
+    on_click callback: puts a saved ticket back into session state (no API calls).
+    Runs before the widgets are rebuilt, so widget-bound keys may be assigned.
+    """
+    state = load_snapshot_state(st.session_state.owner_key, ticket_id)
+    if state is None:
+        st.session_state.resume_error = "The selected ticket is no longer available or could not be read."
+        return
+    for k in list(st.session_state.keys()):
+        if k.startswith("answer_") or k in ("draft_edit", "translated_output"):
+            del st.session_state[k]
+    for k, v in state.items():
+        st.session_state[k] = v
+    st.session_state.ticket_id = ticket_id
+
+
+def set_stage(stage):
+    """
+    Advances the pipeline stage and persists a snapshot of the ticket.
+    """
+    st.session_state.stage = stage
+    save_snapshot()
+
+
 # ----------------------------------------------------------------------
 # Initialize session state
 # ----------------------------------------------------------------------
 def init_state():
     defaults = {
-        "stage": "init",            # init, asked, done, reviewed, translated, reviewed_translation
+        "stage": "init",            # one of STAGES
         "questions": [],            # list of strings
         "answers": {},              # mapping "q0"→answer_text, "q1"→answer_text, ...
         "draft": "",
@@ -127,7 +370,8 @@ def init_state():
         "operator_notes": "",
         "signature": "",            # operator’s personal signature line
         "messages": [],             # full chat history
-        "api_log": []               # list of {"outgoing": [...], "incoming": {...}}
+        "api_log": [],              # list of {"outgoing": [...], "incoming": {...}}
+        "ticket_id": uuid.uuid4().hex  # names this ticket's snapshot file
     }
     for k, v in defaults.items():
         st.session_state.setdefault(k, v)
@@ -135,6 +379,46 @@ def init_state():
 
 init_state()
 
+# The owner key lives in the URL so a reloaded tab finds its own snapshots again
+if "owner_key" not in st.session_state:
+    owner_key = st.query_params.get("owner") or ""
+    # The key becomes a directory name, so anything but a uuid4 hex is replaced
+    st.session_state.owner_key = owner_key if SNAPSHOT_ID_RE.fullmatch(owner_key) else uuid.uuid4().hex
+    st.query_params["owner"] = st.session_state.owner_key
+
+# Apply retention once per browser session
+if "snapshots_pruned" not in st.session_state:
+    prune_expired_snapshots()
+    st.session_state.snapshots_pruned = True
+
+
+# ----------------------------------------------------------------------
+# Resume a saved ticket
+# ----------------------------------------------------------------------
+if st.session_state.get("resume_error"):
+    st.error(st.session_state.pop("resume_error"))
+
+saved_snapshots = {m["ticket_id"]: m for m in list_snapshots(st.session_state.owner_key)}
+if saved_snapshots:
+    with st.expander("♻️ Resume a saved ticket"):
+        def _snapshot_label(ticket_id):
+            snap = saved_snapshots[ticket_id]
+            saved = time.strftime("%Y-%m-%d %H:%M", time.localtime(snap["saved_at"]))
+            return f"{saved} · {snap['stage']} · {snap['preview'] or '(no customer text)'}"
+
+        picked = st.selectbox(
+            "Saved tickets (newest first)",
+            list(saved_snapshots),
+            format_func=_snapshot_label,
+            key="resume_choice"
+        )
+        st.button(
+            "Resume selected ticket",
+            key="btn_resume",
+            on_click=restore_snapshot,
+            args=(picked,)
+        )
+
 
 # ----------------------------------------------------------------------
 # UI Inputs
@@ -157,6 +441,7 @@ st.text_area(
 # (6) Customer message / review (always editable)
 client_review = st.text_area(
     "Customer message or review",
+    key="client_review",
     placeholder="Paste the customer's text here",
     height=140
 )
@@ -170,7 +455,7 @@ st.text_area(
 )
 
 # (8) Response channel: Email (private) or Public post
-st.radio("Response channel", ["Email (private)", "Public post"], key="channel_type", horizontal=True)
+st.radio("Response channel", CHANNEL_OPTIONS, key="channel_type", horizontal=True)
 
 # (9) API key input
 api_key = st.text_input("OpenAI API key", type="password")
@@ -197,6 +482,9 @@ if st.button("Clear fields / Start new task", key="btn_clear"):
         else:
             st.session_state[k] = [] if isinstance(st.session_state[k], list) else {}
 
+    # Start a fresh ticket so its snapshot doesn't overwrite the previous one
+    st.session_state.ticket_id = uuid.uuid4().hex
+
     # Instead of assigning to mode (which conflicts with the radio), delete it:
     if "mode" in st.session_state:
         del st.session_state["mode"]
@@ -302,7 +590,7 @@ if st.button("Generate response draft", key="btn_generate"):
 
             # Store draft and advance stage
             st.session_state.draft = (msg.content or "").strip()
-            st.session_state.stage = "done"
+            set_stage("done")
 
         # ─── ADVANCED MODE ──────────────────────────────────────────────
         else:
@@ -374,21 +662,21 @@ if st.button("Generate response draft", key="btn_generate"):
 
                 if fn == "request_additional_info":
                     st.session_state.questions = args.get("questions", [])
-                    st.session_state.stage = "asked"
+                    set_stage("asked")
                     st.stop()
 
                 elif fn == "compose_reply":
                     st.session_state.draft = (args.get("draft") or "").strip()
-                    st.session_state.stage = "done"
+                    set_stage("done")
 
                 else:
                     # Fallback if something unexpected happened
                     st.session_state.draft = (msg.content or "").strip()
-                    st.session_state.stage = "done"
+                    set_stage("done")
             else:
                 # If no function_call, treat `msg.content` as the draft
                 st.session_state.draft = (msg.content or "").strip()
-                st.session_state.stage = "done"
+                set_stage("done")
 
 # ───────────────────────────────────────────────────────────────────────
 # [1] Show questions & collect operator answers (Advanced “asked” stage)
@@ -398,9 +686,9 @@ if st.session_state.stage == "asked":
 
     # (G) “Edit operator notes” button
     if st.button("↶ Edit operator notes", key="btn_edit_notes"):
-        st.session_state.stage = "init"
         st.session_state.questions = []
         st.session_state.answers = {}
+        set_stage("init")
         st.stop()
 
     st.markdown(
@@ -480,7 +768,7 @@ if st.session_state.stage == "asked":
             else:
                 st.session_state.draft = (msg2.content or "").strip()
 
-            st.session_state.stage = "done"
+            set_stage("done")
             st.stop()
 
 
@@ -508,7 +796,7 @@ if st.session_state.stage == "done" and not st.session_state.reviewed_draft:
         st.stop()
 
     st.session_state.reviewed_draft = (review_msg.content or "").strip()
-    st.session_state.stage = "reviewed"
+    set_stage("reviewed")
 
 
 # ───────────────────────────────────────────────────────────────────────
@@ -535,7 +823,7 @@ if st.session_state.reviewed_draft:
         if st.button("🔄 Regenerate draft", key="btn_regenerate"):
             for k in ["draft", "reviewed_draft", "translation", "reviewed_translation"]:
                 st.session_state[k] = ""
-            st.session_state.stage = "init"
+            set_stage("init")
             st.stop()
     with col2:
         if st.button("🔄 Start over completely", key="btn_reset_all"):
@@ -548,6 +836,7 @@ if st.session_state.reviewed_draft:
                     st.session_state[k] = ""
                 else:
                     st.session_state[k] = [] if isinstance(st.session_state[k], list) else {}
+            st.session_state.ticket_id = uuid.uuid4().hex
             st.stop()
 
     # (5) Download final reply
@@ -586,7 +875,7 @@ if st.session_state.reviewed_draft:
             st.stop()
 
         st.session_state.translation = (msg_trans.content or "").strip()
-        st.session_state.stage = "translated"
+        set_stage("translated")
 
     # If a raw translation exists but hasn't been reviewed yet
     if st.session_state.translation and not st.session_state.reviewed_translation:
@@ -608,7 +897,7 @@ if st.session_state.reviewed_draft:
             st.stop()
 
         st.session_state.reviewed_translation = (rev_msg.content or "").strip()
-        st.session_state.stage = "reviewed_translation"
+        set_stage("reviewed_translation")
 
     # If a reviewed translation exists, show it
     if st.session_state.reviewed_translation: